@@ -7,58 +7,446 @@ Differences from previous version:
 - All instrumentation (transmitters / analysers) are clean first-order lags.
 - Raw water quality variation (TDS, H2S) is handled deterministically inside
   the process model to emulate realistic "noise" at the plant level.
+- The numerical core runs as a Numba-compiled kernel over a flat state
+  vector; set DVWTP_NO_JIT=1 to execute the same kernel as plain Python.
+- The simulation runs as an asyncio task on the Modbus server's event loop;
+  the web dashboard is served from its own threads.
 
-Requires: pip install pymodbus
+Requires: pip install pymodbus numpy numba
 """
 
+import asyncio
+import hashlib
 import json
 import math
+import os
 import threading
 import time
-from dataclasses import dataclass
+from collections.abc import Mapping
 from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from typing import Dict, Optional
+from types import MappingProxyType
+from typing import Dict, Iterator, NamedTuple, Optional, Sequence, Tuple
 
+import numpy as np
 from pymodbus.datastore import (
     ModbusSequentialDataBlock,
     ModbusServerContext,
     ModbusSlaveContext,
 )
-from pymodbus.server import StartTcpServer
+from pymodbus.server import StartAsyncTcpServer
+
+if os.environ.get("DVWTP_NO_JIT", "").lower() in ("1", "true", "yes"):
+    njit = None
+else:
+    try:
+        from numba import njit, prange
+    except ImportError:  # numba is optional; fall back to the interpreter
+        njit = None
+
+if njit is None:
+    prange = range
+
+    def njit(*args, **kwargs):
+        """Stand-in for ``numba.njit`` that returns the function unchanged."""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda fn: fn
+
+try:
+    import orjson
+
+    _dumps = orjson.dumps
+except ImportError:  # orjson is optional; compact stdlib JSON otherwise
+    # One shared encoder instead of a fresh one per json.dumps() call; the
+    # payloads are plain trees of dicts/floats, so skip the cycle check
+    _encode = json.JSONEncoder(separators=(",", ":"), check_circular=False).encode
+
+    def _dumps(obj) -> bytes:
+        """Serialise obj to compact UTF-8 JSON bytes."""
+        return _encode(obj).encode()
+
+
+# ---------------------------------------------------------------------------
+# State / parameter / control vector layout
+# ---------------------------------------------------------------------------
+
+STATE_KEYS = (
+    # Flows (m3/h)
+    "Q_feed",
+    "Q_perm",
+    "Q_brine",
+    "Q_out",
+    "Q_feed_target",
+    # Quality
+    "TDS_feed",
+    "TDS_perm",
+    "TDS_brine",
+    "H2S_feed",
+    "H2S_out",
+    "pH_true",
+    "Cl_true",
+    "dP_ro_true",
+    # Tank
+    "V_clearwell",
+    "level_clearwell",
+    # Measurements (updated by sensors)
+    "Q_feed_meas",
+    "Q_perm_meas",
+    "level_clearwell_meas",
+    "pH_meas",
+    "Cl_meas",
+    "dP_ro_meas",
+)
+(
+    IDX_Q_FEED,
+    IDX_Q_PERM,
+    IDX_Q_BRINE,
+    IDX_Q_OUT,
+    IDX_Q_FEED_TARGET,
+    IDX_TDS_FEED,
+    IDX_TDS_PERM,
+    IDX_TDS_BRINE,
+    IDX_H2S_FEED,
+    IDX_H2S_OUT,
+    IDX_PH_TRUE,
+    IDX_CL_TRUE,
+    IDX_DP_RO_TRUE,
+    IDX_V_CLEARWELL,
+    IDX_LEVEL_CLEARWELL,
+    IDX_Q_FEED_MEAS,
+    IDX_Q_PERM_MEAS,
+    IDX_LEVEL_MEAS,
+    IDX_PH_MEAS,
+    IDX_CL_MEAS,
+    IDX_DP_RO_MEAS,
+) = range(len(STATE_KEYS))
+STATE_IDX = {key: i for i, key in enumerate(STATE_KEYS)}
+
+PARAM_KEYS = (
+    "Q_well_nom",
+    "TDS_raw_base",
+    "TDS_raw_amp",
+    "H2S_raw_base",
+    "H2S_raw_amp",
+    "recovery_clean",
+    "recovery_dTDS",
+    "salt_rejection_clean",
+    "salt_rejection_dTDS",
+    "dP_clean_bar",
+    "dP_dTDS_bar",
+    "degas_eff",
+    "pH_base",
+    "NaOH_nom",
+    "alkalinity_meq",
+    "tau_pH",
+    "A_clearwell",
+    "V_init",
+    "Q_out_nom",
+    "pump_tau",
+    "Cl_nom",
+    "k_Cl_base",
+    "k_Cl_pH_gain",
+    "k_Cl_temp_gain",
+    "temp_C",
+)
+(
+    P_Q_WELL_NOM,
+    P_TDS_RAW_BASE,
+    P_TDS_RAW_AMP,
+    P_H2S_RAW_BASE,
+    P_H2S_RAW_AMP,
+    P_RECOVERY_CLEAN,
+    P_RECOVERY_DTDS,
+    P_SALT_REJECTION_CLEAN,
+    P_SALT_REJECTION_DTDS,
+    P_DP_CLEAN_BAR,
+    P_DP_DTDS_BAR,
+    P_DEGAS_EFF,
+    P_PH_BASE,
+    P_NAOH_NOM,
+    P_ALKALINITY_MEQ,
+    P_TAU_PH,
+    P_A_CLEARWELL,
+    P_V_INIT,
+    P_Q_OUT_NOM,
+    P_PUMP_TAU,
+    P_CL_NOM,
+    P_K_CL_BASE,
+    P_K_CL_PH_GAIN,
+    P_K_CL_TEMP_GAIN,
+    P_TEMP_C,
+) = range(len(PARAM_KEYS))
+
+# Time-invariant quantities derived from PARAM_KEYS, appended to the same
+# vector so the kernel never repeats them per step
+DERIVED_KEYS = (
+    "inv_pump_tau",
+    "inv_tau_pH",
+    "alkalinity_mol",
+    "k_Cl_temp",
+    "k_Cl_pH",
+    "inv_A_clearwell",
+    "degas_pass",
+)
+(
+    P_INV_PUMP_TAU,
+    P_INV_TAU_PH,
+    P_ALKALINITY_MOL,
+    P_K_CL_TEMP,
+    P_K_CL_PH,
+    P_INV_A_CLEARWELL,
+    P_DEGAS_PASS,
+) = range(len(PARAM_KEYS), len(PARAM_KEYS) + len(DERIVED_KEYS))
+
+SEC_TO_HOUR = 1.0 / 3600.0
+SEC_PER_DAY = 86400.0
+OMEGA_DAY = 2.0 * math.pi / SEC_PER_DAY  # rad/s, diurnal raw-water cycle
+SQRT2_OVER_2 = 0.7071067811865476  # sin(pi/4) == cos(pi/4)
+# Longest explicit Euler step (s); larger dt is split into equal substeps so
+# the fastest sensor lag (tau = 2 s) stays stable after a scheduling stall
+MAX_SUBSTEP = 1.0
+
+CONTROL_KEYS = (
+    "wellfield_on",
+    "ro_on",
+    "dist_pump_on",
+    "NaOH_dose",
+    "Cl_dose",
+    "Q_out_sp",
+)
+(
+    CTRL_WELLFIELD_ON,
+    CTRL_RO_ON,
+    CTRL_DIST_PUMP_ON,
+    CTRL_NAOH_DOSE,
+    CTRL_CL_DOSE,
+    CTRL_Q_OUT_SP,
+) = range(len(CONTROL_KEYS))
 
 
 # ---------------------------------------------------------------------------
 # Instrumentation model – clean, lag only
 # ---------------------------------------------------------------------------
 
-@dataclass
-class Sensor:
+class Sensor(NamedTuple):
+    """Metadata for one transmitter; the lag itself runs inside the kernel."""
+
     tag: str
-    pv_key: str  # true process variable key in state dict
-    meas_key: str  # measured value key in state dict
+    pv_key: str  # true process variable key in state vector
+    meas_key: str  # measured value key in state vector
     tau: float = 5.0  # time constant (s)
 
-    def step(self, state: Dict[str, float], dt: float) -> None:
-        """Update measured value with first-order lag (no noise, no bias)."""
-        true_val = state.get(self.pv_key, 0.0)
-        meas_old = state.get(self.meas_key, true_val)
 
-        # first-order lag
-        alpha = dt / max(self.tau, 1e-6)
-        meas_new = meas_old + alpha * (true_val - meas_old)
+# ---------------------------------------------------------------------------
+# Compiled process kernel
+# ---------------------------------------------------------------------------
+
+@njit(cache=True, fastmath=True, error_model="numpy")
+def _ro_performance(params: np.ndarray, feed_tds: float):
+    """Return recovery, salt rejection, and dP adjusted for feed quality."""
+    d_tds_g = max(0.0, (feed_tds - params[P_TDS_RAW_BASE]) * 1e-3)
+
+    recovery = params[P_RECOVERY_CLEAN] - params[P_RECOVERY_DTDS] * d_tds_g
+    recovery = min(max(recovery, 0.55), 0.82)
+
+    salt_rejection = params[P_SALT_REJECTION_CLEAN] - params[P_SALT_REJECTION_DTDS] * d_tds_g
+    salt_rejection = min(max(salt_rejection, 0.9), 0.99)
+
+    dP = params[P_DP_CLEAN_BAR] + params[P_DP_DTDS_BAR] * d_tds_g
+
+    return recovery, salt_rejection, dP
+
+
+@njit(cache=True, fastmath=True, error_model="numpy")
+def _ph_from_naoh(params: np.ndarray, NaOH_dose: float, current_pH: float, dt: float) -> float:
+    """Buffer-aware pH update using alkalinity and NaOH addition (log scale)."""
+    # NaOH dose mg/L -> mol/L (MW=40 g/mol)
+    oh_add_mol = max(0.0, NaOH_dose) * (1.0 / 40000.0)
+    # Assume baseline OH- from alkalinity (mol/L); convert pH to H+ concentration
+    h_conc = 10.0 ** (-current_pH)
+    oh_conc = max(1e-12, params[P_ALKALINITY_MOL] + oh_add_mol)
+    # Net hydroxide after neutralising existing H+
+    net_oh = max(1e-12, oh_conc - h_conc)
+    target_pH = 14.0 + math.log10(net_oh)
+    return current_pH + dt * params[P_INV_TAU_PH] * (target_pH - current_pH)
+
+
+@njit(cache=True, fastmath=True, error_model="numpy")
+def _step_core(
+    state: np.ndarray,
+    params: np.ndarray,
+    controls: np.ndarray,
+    dt: float,
+    sim_time: float,
+    sensor_pv: np.ndarray,
+    sensor_meas: np.ndarray,
+    sensor_inv_tau: np.ndarray,
+) -> None:
+    """Advance the state vector in place by dt seconds."""
+    s = state
+
+    # ------------------ 0. Raw water quality (deterministic) -----------
+    theta = OMEGA_DAY * (sim_time % SEC_PER_DAY)  # wrap to 0–24 h
+    sin_theta = math.sin(theta)
+    cos_theta = math.cos(theta)
+    # sin(theta + pi/4) via the angle-sum identity (LLVM fuses sin/cos of theta)
+    sin_theta_pi4 = SQRT2_OVER_2 * (sin_theta + cos_theta)
+    TDS = params[P_TDS_RAW_BASE] + params[P_TDS_RAW_AMP] * sin_theta
+    H2S = params[P_H2S_RAW_BASE] + params[P_H2S_RAW_AMP] * sin_theta_pi4
+    s[IDX_TDS_FEED] = max(0.0, TDS)
+    s[IDX_H2S_FEED] = max(0.0, H2S)
+
+    # ------------------ 1. Wellfield / raw water -------------------
+    pump_gain = dt * params[P_INV_PUMP_TAU]
+    s[IDX_Q_FEED_TARGET] = params[P_Q_WELL_NOM] if controls[CTRL_WELLFIELD_ON] > 0.5 else 0.0
+    s[IDX_Q_FEED] += pump_gain * (s[IDX_Q_FEED_TARGET] - s[IDX_Q_FEED])
+
+    # ------------------ 2. RO unit (steady each step) ---------------
+    Qf = s[IDX_Q_FEED]
+    Cf = s[IDX_TDS_FEED]
+
+    if controls[CTRL_RO_ON] > 0.5 and Qf > 1e-6:
+        R, SR, dP = _ro_performance(params, Cf)
+
+        Qp = R * Qf
+        Qb = (1.0 - R) * Qf
+        Cp = (1.0 - SR) * Cf
+        inv_Qb = 1.0 / max(Qb, 1e-6)
+        Cb = (Qf * Cf - Qp * Cp) * inv_Qb
+        s[IDX_DP_RO_TRUE] = dP
+    else:
+        Qp = 0.0
+        Qb = Qf
+        Cp = s[IDX_TDS_PERM]
+        Cb = Cf
+        s[IDX_DP_RO_TRUE] = 0.0
+
+    s[IDX_Q_PERM] = Qp
+    s[IDX_Q_BRINE] = Qb
+    s[IDX_TDS_PERM] = Cp
+    s[IDX_TDS_BRINE] = Cb
+
+    # ------------------ 3. Degas tower (H2S removal) ---------------
+    s[IDX_H2S_OUT] = params[P_DEGAS_PASS] * s[IDX_H2S_FEED]
+
+    # ------------------ 4. NaOH dosing -> pH dynamics ---------------
+    s[IDX_PH_TRUE] = _ph_from_naoh(params, controls[CTRL_NAOH_DOSE], s[IDX_PH_TRUE], dt)
+
+    # ------------------ 5. Clearwell & chlorine ---------------------
+    Q_in = s[IDX_Q_PERM]  # from RO
+    if controls[CTRL_DIST_PUMP_ON] > 0.5:
+        Q_out_target = max(0.0, controls[CTRL_Q_OUT_SP])
+    else:
+        Q_out_target = 0.0
+    s[IDX_Q_OUT] += pump_gain * (Q_out_target - s[IDX_Q_OUT])
+    Q_out = max(0.0, s[IDX_Q_OUT])
+
+    # Convert flows m3/h -> m3 over dt
+    dt_h = dt * SEC_TO_HOUR
+    V_new = max(0.0, s[IDX_V_CLEARWELL] + (Q_in - Q_out) * dt_h)
+
+    s[IDX_V_CLEARWELL] = V_new
+    s[IDX_LEVEL_CLEARWELL] = V_new * params[P_INV_A_CLEARWELL]
+    s[IDX_Q_OUT] = Q_out
+
+    # Chlorine CSTR dynamics:
+    C = s[IDX_CL_TRUE]
+    C_in = 0.0  # assume no chlorine in RO permeate
+    u_Cl = controls[CTRL_CL_DOSE]
+    if V_new > 1e-6:
+        k_Cl = params[P_K_CL_TEMP] + params[P_K_CL_PH] * max(0.0, s[IDX_PH_TRUE] - 7.0)
+        inv_V = 1.0 / V_new
+        dCdt = Q_in * inv_V * (C_in + u_Cl - C) - k_Cl * C
+    else:
+        dCdt = -params[P_K_CL_BASE] * C
+
+    s[IDX_CL_TRUE] = max(0.0, C + dt_h * dCdt)
+
+    # ------------------ 6. Instrumentation update -------------------
+    # First-order lag on every transmitter (no noise, no bias); a scalar loop
+    # over the index/tau arrays avoids fancy-indexing temporaries
+    for i in range(sensor_pv.shape[0]):
+        m = s[sensor_meas[i]]
+        s[sensor_meas[i]] = m + dt * sensor_inv_tau[i] * (s[sensor_pv[i]] - m)
+
+
+@njit(cache=True, fastmath=True, parallel=True, error_model="numpy")
+def _step_batch(
+    states: np.ndarray,
+    params: np.ndarray,
+    controls: np.ndarray,
+    dt: float,
+    sim_time: float,
+    sensor_pv: np.ndarray,
+    sensor_meas: np.ndarray,
+    sensor_inv_tau: np.ndarray,
+) -> None:
+    """Advance every row of states in place, one independent twin per row."""
+    for i in prange(states.shape[0]):
+        _step_core(states[i], params[i], controls[i], dt, sim_time, sensor_pv, sensor_meas, sensor_inv_tau)
+
+
+def _pack_params(p: Dict[str, float]) -> np.ndarray:
+    """Pack a params dict plus its derived constants into a kernel vector."""
+    derived = {
+        "inv_pump_tau": 1.0 / max(p["pump_tau"], 1e-6),
+        "inv_tau_pH": 1.0 / max(p["tau_pH"], 1e-6),
+        # 1 meq/L = 1e-3 eq/L
+        "alkalinity_mol": p["alkalinity_meq"] * 1e-3,
+        # Chlorine decay k = k_Cl_temp + k_Cl_pH * max(0, pH - 7), in 1/h
+        "k_Cl_temp": p["k_Cl_base"] * (1.0 + p["k_Cl_temp_gain"] * max(0.0, p["temp_C"] - 20.0)),
+        "k_Cl_pH": p["k_Cl_base"] * p["k_Cl_pH_gain"],
+        "inv_A_clearwell": 1.0 / p["A_clearwell"],
+        "degas_pass": 1.0 - p["degas_eff"],
+    }
+    return np.array(
+        [p[k] for k in PARAM_KEYS] + [derived[k] for k in DERIVED_KEYS],
+        dtype=np.float64,
+    )
+
 
-        state[self.meas_key] = meas_new
+def pack_controls(controls: Dict[str, float]) -> np.ndarray:
+    """Pack a controls dict into a kernel vector ordered by CONTROL_KEYS."""
+    return np.array([float(controls[k]) for k in CONTROL_KEYS], dtype=np.float64)
 
 
 # ---------------------------------------------------------------------------
 # Process model
 # ---------------------------------------------------------------------------
 
+class StateView(Mapping):
+    """Read-only named view over a state vector: view.Q_feed or view["Q_feed"]."""
+
+    __slots__ = ("_values",)
+
+    def __init__(self, values: np.ndarray) -> None:
+        self._values = values
+
+    def __getitem__(self, key: str) -> float:
+        return float(self._values[STATE_IDX[key]])
+
+    def __getattr__(self, key: str) -> float:
+        # Only state fields resolve here; private and dunder names (e.g. the
+        # unset _values slot during copy/pickle) must fail without recursing
+        if key.startswith("_"):
+            raise AttributeError(key)
+        try:
+            return float(self._values[STATE_IDX[key]])
+        except KeyError:
+            raise AttributeError(key) from None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(STATE_KEYS)
+
+    def __len__(self) -> int:
+        return len(STATE_KEYS)
+
+
 class WTPTwin:
     def __init__(self) -> None:
-        # --- Parameters (tune as you like) ---
-        self.params = {
+        # --- Parameters (tune as you like; change them via update_params) ---
+        params = {
             # Raw water / RO
             "Q_well_nom": 100.0,  # m3/h total wellfield flow when on
             "TDS_raw_base": 2500.0,  # mg/L, base value
@@ -89,18 +477,33 @@ class WTPTwin:
             "k_Cl_temp_gain": 0.02,  # fractional increase per degC above 20C
             "temp_C": 24.0,  # assumed bulk temperature
         }
+        self._set_params(params)
+        self.params_version = 0  # bumped by update_params()
 
         # Simulation time (s)
         self.time = 0.0
 
-        # Synchronisation primitive for concurrent readers (Modbus + web UI)
-        self._lock = threading.RLock()
+        # Publication guard for concurrent readers (Modbus + web UI). Held
+        # only while swapping state buffers, never during the computation.
+        self._publish_lock = threading.Lock()
+        self._publish_seq = 0
+
+        # Last decoded Modbus controls and the raw register values behind them
+        self._controls_cache: Dict[str, float] = dict.fromkeys(CONTROL_KEYS, 0.0)
+        self._controls_raw: Optional[list] = None
+        # Scratch buffers reused every tick by step() and the Modbus writer
+        self._controls_vec = np.zeros(len(CONTROL_KEYS), dtype=np.float64)
+        self._meas_buf = np.zeros(len(MODBUS_MEAS_KEYS), dtype=np.float64)
+        self._meas_regs = np.zeros(len(MODBUS_MEAS_KEYS), dtype=np.int32)
+        # Pinned Modbus datastore blocks (bound on first scan)
+        self._coil_block: Optional["_BlockView"] = None
+        self._hr_block: Optional["_BlockView"] = None
 
         # --- Process state (true physical values) ---
         V0 = self.params["V_init"]
         h0 = V0 / self.params["A_clearwell"]
 
-        self.state = {
+        initial_state = {
             # Flows (m3/h)
             "Q_feed": 0.0,
             "Q_perm": 0.0,
@@ -127,6 +530,10 @@ class WTPTwin:
             "Cl_meas": 0.5,
             "dP_ro_meas": 1.2,
         }
+        # Double-buffered state vector: step() computes into the inactive
+        # buffer and publishes it by swapping references
+        self._state_current = np.array([initial_state[k] for k in STATE_KEYS], dtype=np.float64)
+        self._state_inactive = self._state_current.copy()
 
         # --- Instrumentation objects (clean) ---
         self.sensors = [
@@ -137,10 +544,58 @@ class WTPTwin:
             Sensor("CL-AT-601", "Cl_true", "Cl_meas", tau=30.0),
             Sensor("DP-501", "dP_ro_true", "dP_ro_meas", tau=5.0),
         ]
+        # Structure-of-arrays view of the sensor bank consumed by the kernel
+        self._sensor_pv_idx = np.array([STATE_IDX[x.pv_key] for x in self.sensors], dtype=np.intp)
+        self._sensor_meas_idx = np.array([STATE_IDX[x.meas_key] for x in self.sensors], dtype=np.intp)
+        self._sensor_inv_tau = 1.0 / np.maximum([x.tau for x in self.sensors], 1e-6)
 
         # Bring plant to a sensible steady-state before exposing measurements
         self._settle_initial_state()
 
+    # ------------------------------------------------------------------ #
+    @property
+    def params(self) -> Mapping:
+        """Read-only view of the current parameters; use update_params() to change them."""
+        return self._params_view
+
+    def _set_params(self, params: Dict[str, float]) -> None:
+        """Install a params dict with its frozen kernel vector, including derived constants."""
+        # Pack first so an invalid value raises before anything is replaced
+        vec = _pack_params(params)
+        vec.flags.writeable = False
+        self._params_view = MappingProxyType(params)
+        self._params_vec = vec
+
+    # ------------------------------------------------------------------ #
+    def update_params(self, changes: Dict[str, float]) -> None:
+        """Apply parameter changes and refresh the derived constants."""
+        unknown = set(changes) - set(PARAM_KEYS)
+        if unknown:
+            raise KeyError(f"unknown parameter(s): {', '.join(sorted(unknown))}")
+        with self._publish_lock:
+            self._set_params({**self._params_view, **changes})
+            self.params_version += 1
+
+    # ------------------------------------------------------------------ #
+    def _read_published(self) -> Tuple[float, np.ndarray]:
+        """
+        Return (time, state copy) of the published buffer without blocking
+        step(). The copy is retried if a newer state was published meanwhile,
+        as the writer may then already be reusing the buffer.
+        """
+        while True:
+            with self._publish_lock:
+                buf, sim_time, seq = self._state_current, self.time, self._publish_seq
+            values = buf.copy()
+            if self._publish_seq == seq:
+                return sim_time, values
+
+    # ------------------------------------------------------------------ #
+    @property
+    def state(self) -> StateView:
+        """Named, read-only view over a copy of the current state vector."""
+        return StateView(self._read_published()[1])
+
     # ------------------------------------------------------------------ #
     def _settle_initial_state(self) -> None:
         """Iterate the model to reach a quasi steady-state starting point."""
@@ -156,241 +611,360 @@ class WTPTwin:
             self.step(1.0, default_controls)
 
     # ------------------------------------------------------------------ #
-    def _update_raw_water_quality(self) -> None:
+    def step(self, dt: float, controls: Dict[str, float]) -> None:
         """
-        Deterministic variation of raw water TDS and H2S based on time of day.
-        No randomness – this is the only "noise" source.
+        Advance process by dt seconds using controls:
+        controls = {
+            "wellfield_on": bool,
+            "ro_on": bool,
+            "dist_pump_on": bool,
+            "NaOH_dose": float (mg/L),
+            "Cl_dose": float (mg/L),
+            "Q_out_sp": float (m3/h),
+        }
+        Call snapshot() afterwards to read the resulting state. Only one
+        thread may call step(); readers never block it. A dt longer than
+        MAX_SUBSTEP is integrated in equal substeps and published once.
         """
-        p = self.params
-        t_hours = (self.time / 3600.0) % 24.0  # wrap to 0–24 h
-
-        # Simple sinusoidal variation over 24h
-        theta = 2.0 * math.pi * t_hours / 24.0
-        TDS = p["TDS_raw_base"] + p["TDS_raw_amp"] * math.sin(theta)
-        H2S = p["H2S_raw_base"] + p["H2S_raw_amp"] * math.sin(theta + math.pi / 4)
+        controls_vec = self._controls_vec
+        for i, key in enumerate(CONTROL_KEYS):
+            controls_vec[i] = controls[key]
+
+        # Advance simulation time
+        new_time = self.time + dt
+        n_sub = max(1, math.ceil(dt / MAX_SUBSTEP))
+        sub_dt = float(dt) / n_sub
+
+        buf = self._state_inactive
+        buf[:] = self._state_current
+        for k in range(1, n_sub + 1):
+            _step_core(
+                buf,
+                self._params_vec,
+                controls_vec,
+                sub_dt,
+                new_time if k == n_sub else self.time + k * sub_dt,
+                self._sensor_pv_idx,
+                self._sensor_meas_idx,
+                self._sensor_inv_tau,
+            )
+
+        with self._publish_lock:
+            self._state_inactive = self._state_current
+            self._state_current = buf
+            self.time = new_time
+            self._publish_seq += 1
 
-        self.state["TDS_feed"] = max(0.0, TDS)
-        self.state["H2S_feed"] = max(0.0, H2S)
+    # ------------------------------------------------------------------ #
+    def state_vector(self) -> np.ndarray:
+        """Thread-safe copy of the raw state vector (indexed by STATE_IDX)."""
+        return self._read_published()[1]
 
     # ------------------------------------------------------------------ #
-    def _effective_ro_performance(self, feed_tds: float) -> Dict[str, float]:
-        """Return recovery, salt rejection, and dP adjusted for feed quality."""
-        p = self.params
-        d_tds_g = max(0.0, (feed_tds - p["TDS_raw_base"]) / 1000.0)
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Thread-safe shallow copy of params and state for external readers."""
+        sim_time, values = self._read_published()
+        state = dict(zip(STATE_KEYS, values.tolist()))
+        with self._publish_lock:
+            params = dict(self.params)
+        return {
+            "time": sim_time,
+            "params": params,
+            "state": state,
+        }
 
-        recovery = p["recovery_clean"] - p["recovery_dTDS"] * d_tds_g
-        recovery = min(max(recovery, 0.55), 0.82)
 
-        salt_rejection = p["salt_rejection_clean"] - p["salt_rejection_dTDS"] * d_tds_g
-        salt_rejection = min(max(salt_rejection, 0.9), 0.99)
+class WTPTwinBatch:
+    """
+    Independent twins stepped together for offline scenario sweeps.
+    Each scenario starts from the settled default plant with its own
+    parameter overrides; row i of every array belongs to scenario i.
+    """
 
-        dP = p["dP_clean_bar"] + p["dP_dTDS_bar"] * d_tds_g
+    def __init__(self, param_overrides: Sequence[Dict[str, float]]) -> None:
+        base = WTPTwin()
+        for overrides in param_overrides:
+            unknown = set(overrides) - set(PARAM_KEYS)
+            if unknown:
+                raise KeyError(f"unknown parameter(s): {', '.join(sorted(unknown))}")
 
-        return {
-            "recovery": recovery,
-            "salt_rejection": salt_rejection,
-            "dP": dP,
-        }
+        self.time = base.time
+        self.params = [{**base.params, **overrides} for overrides in param_overrides]
+        self._params_mat = np.stack([_pack_params(p) for p in self.params])
+        self.states = np.tile(base.state_vector(), (len(self.params), 1))
+        self._sensor_pv_idx = base._sensor_pv_idx
+        self._sensor_meas_idx = base._sensor_meas_idx
+        self._sensor_inv_tau = base._sensor_inv_tau
 
-    # ------------------------------------------------------------------ #
-    def _pH_from_NaOH(self, NaOH_dose: float, current_pH: float, dt: float) -> float:
-        """Buffer-aware pH update using alkalinity and NaOH addition (log scale)."""
-        p = self.params
-        # Convert alkalinity to mol/L (1 meq/L = 1e-3 eq/L)
-        alkalinity_mol = p["alkalinity_meq"] * 1e-3
-        # NaOH dose mg/L -> mol/L (MW=40 g/mol)
-        oh_add_mol = max(0.0, NaOH_dose) / 40000.0
-        # Assume baseline OH- from alkalinity; convert pH to H+ concentration
-        h_conc = 10 ** (-current_pH)
-        oh_conc = max(1e-12, alkalinity_mol + oh_add_mol)
-        # Net hydroxide after neutralising existing H+
-        net_oh = max(1e-12, oh_conc - h_conc)
-        target_pH = 14.0 + math.log10(net_oh)
-        tau_pH = p["tau_pH"]
-        return current_pH + dt / max(tau_pH, 1e-6) * (target_pH - current_pH)
+    def __len__(self) -> int:
+        return self.states.shape[0]
 
     # ------------------------------------------------------------------ #
-    def step(self, dt: float, controls: Dict[str, float]) -> Dict[str, float]:
+    def step(self, dt: float, controls: np.ndarray) -> None:
         """
-        Advance process by dt seconds using controls:
-        controls = {
-            "wellfield_on": bool,
-            "ro_on": bool,
-            "dist_pump_on": bool,
-            "NaOH_dose": float (mg/L),
-            "Cl_dose": float (mg/L),
-            "Q_out_sp": float (m3/h),
-        }
+        Advance all scenarios by dt seconds. controls is either one vector
+        (see pack_controls) shared by every scenario, or an (N, 6) array.
+        Like WTPTwin.step, dt is split into substeps of at most MAX_SUBSTEP.
         """
-        p = self.params
-        with self._lock:
-            s = self.state
-
-            # Advance simulation time
-            self.time += dt
-
-            # Update raw water quality deterministically
-            self._update_raw_water_quality()
-
-            # ------------------ 1. Wellfield / raw water -------------------
-            pump_tau = p["pump_tau"]
-            s["Q_feed_target"] = p["Q_well_nom"] if controls["wellfield_on"] else 0.0
-            s["Q_feed"] += dt / max(pump_tau, 1e-6) * (s["Q_feed_target"] - s["Q_feed"])
-
-            # ------------------ 2. RO unit (steady each step) ---------------
-            Qf = s["Q_feed"]
-            Cf = s["TDS_feed"]
-
-            if controls["ro_on"] and Qf > 1e-6:
-                perf = self._effective_ro_performance(Cf)
-                R = perf["recovery"]
-                SR = perf["salt_rejection"]
-
-                Qp = R * Qf
-                Qb = (1.0 - R) * Qf
-                Cp = (1.0 - SR) * Cf
-                Cb = (Qf * Cf - Qp * Cp) / max(Qb, 1e-6)
-                s["dP_ro_true"] = perf["dP"]
-            else:
-                Qp = 0.0
-                Qb = Qf
-                Cp = s["TDS_perm"]
-                Cb = Cf
-                s["dP_ro_true"] = 0.0
-
-            s["Q_perm"] = Qp
-            s["Q_brine"] = Qb
-            s["TDS_perm"] = Cp
-            s["TDS_brine"] = Cb
-
-            # ------------------ 3. Degas tower (H2S removal) ---------------
-            eta = p["degas_eff"]
-            s["H2S_out"] = (1.0 - eta) * s["H2S_feed"]
-
-            # ------------------ 4. NaOH dosing -> pH dynamics ---------------
-            u_NaOH = controls["NaOH_dose"]
-            s["pH_true"] = self._pH_from_NaOH(u_NaOH, s["pH_true"], dt)
-
-            # ------------------ 5. Clearwell & chlorine ---------------------
-            Q_in = s["Q_perm"]  # from RO
-            Q_out_target = max(0.0, controls["Q_out_sp"]) if controls["dist_pump_on"] else 0.0
-            s["Q_out"] += dt / max(pump_tau, 1e-6) * (Q_out_target - s["Q_out"])
-            Q_out = max(0.0, s["Q_out"])
-
-            # Convert flows m3/h -> m3 over dt
-            V = s["V_clearwell"]
-            dV = (Q_in - Q_out) * (dt / 3600.0)
-            V_new = V + dV
-            V_new = max(0.0, V_new)
-
-            s["V_clearwell"] = V_new
-            s["level_clearwell"] = V_new / p["A_clearwell"]
-            s["Q_out"] = Q_out
-
-            # Chlorine CSTR dynamics:
-            C = s["Cl_true"]
-            C_in = 0.0  # assume no chlorine in RO permeate
-            u_Cl = controls["Cl_dose"]
-            if V_new > 1e-6:
-                k_Cl = p["k_Cl_base"] * (
-                    1.0
-                    + p["k_Cl_pH_gain"] * max(0.0, s["pH_true"] - 7.0)
-                    + p["k_Cl_temp_gain"] * max(0.0, p["temp_C"] - 20.0)
-                )
-                dCdt = (Q_in / V_new) * (C_in + u_Cl - C) - k_Cl * C
-            else:
-                dCdt = -p["k_Cl_base"] * C
-
-            s["Cl_true"] = max(0.0, C + (dt / 3600.0) * dCdt)
-
-            # ------------------ 6. Instrumentation update -------------------
-            for sensor in self.sensors:
-                sensor.step(s, dt)
-
-            self.state = s
-            return dict(self.state)
+        controls = np.ascontiguousarray(
+            np.broadcast_to(np.asarray(controls, dtype=np.float64), (len(self), len(CONTROL_KEYS)))
+        )
+        n_sub = max(1, math.ceil(dt / MAX_SUBSTEP))
+        sub_dt = float(dt) / n_sub
+        start = self.time
+        self.time += dt
+        for k in range(1, n_sub + 1):
+            _step_batch(
+                self.states,
+                self._params_mat,
+                controls,
+                sub_dt,
+                self.time if k == n_sub else start + k * sub_dt,
+                self._sensor_pv_idx,
+                self._sensor_meas_idx,
+                self._sensor_inv_tau,
+            )
 
     # ------------------------------------------------------------------ #
-    def snapshot(self) -> Dict[str, Dict[str, float]]:
-        """Thread-safe shallow copy of params and state for external readers."""
-        with self._lock:
-            return {
-                "time": self.time,
-                "params": dict(self.params),
-                "state": dict(self.state),
-            }
+    def column(self, key: str) -> np.ndarray:
+        """Copy of one state field across all scenarios."""
+        return self.states[:, STATE_IDX[key]].copy()
 
 
 # ---------------------------------------------------------------------------
 # Modbus glue
 # ---------------------------------------------------------------------------
 
-def read_controls_from_modbus(context: ModbusServerContext, twin: WTPTwin) -> Dict[str, float]:
-    """Read coils & holding registers and convert to engineering units."""
-    slave = context[0]
+class _BlockView:
+    """Pinned slice access to a sequential datastore block, skipping pymodbus dispatch."""
 
-    # Coils: 0=wellfield_on, 1=ro_on, 2=dist_pump_on
-    coils = slave.getValues(1, 0, 3)
-    wellfield_on, ro_on, dist_pump_on = map(bool, coils[:3])
-
-    # Holding registers: 100=NaOH*100, 101=Cl*100, 102=Q_out*10
-    hr = slave.getValues(3, 100, 3)
-    NaOH_dose = hr[0] / 100.0  # mg/L
-    Cl_dose = hr[1] / 100.0  # mg/L
-    Q_out_sp = hr[2] / 10.0  # m3/h
-
-    controls = {
-        "wellfield_on": wellfield_on,
-        "ro_on": ro_on,
-        "dist_pump_on": dist_pump_on,
-        "NaOH_dose": NaOH_dose,
-        "Cl_dose": Cl_dose,
-        "Q_out_sp": Q_out_sp,
-    }
-    return controls
+    def __init__(self, slave: ModbusSlaveContext, fc: int) -> None:
+        block = slave.store[slave.decode(fc)]
+        self._values = block.values
+        # pymodbus shifts protocol addresses by one unless zero_mode is set
+        self._offset = (0 if slave.zero_mode else 1) - block.address
 
+    def get(self, address: int, count: int) -> list:
+        start = address + self._offset
+        return self._values[start : start + count]
 
-def write_measurements_to_modbus(context: ModbusServerContext, state: Dict[str, float]) -> None:
-    """Write measured values into holding registers (scaled integers)."""
-    slave = context[0]
+    def set(self, address: int, values: list) -> None:
+        # A single slice assignment is atomic with respect to the HTTP threads
+        start = address + self._offset
+        self._values[start : start + len(values)] = values
 
-    # Scale to integers (OpenPLC-friendly)
-    Q_feed_meas = int(max(0.0, state.get("Q_feed_meas", 0.0)) * 10.0)  # 0.1 m3/h
-    Q_perm_meas = int(max(0.0, state.get("Q_perm_meas", 0.0)) * 10.0)  # 0.1 m3/h
-    level_meas = int(max(0.0, state.get("level_clearwell_meas", 0.0)) * 100.0)  # cm
-    pH_meas = int(max(0.0, state.get("pH_meas", 0.0)) * 100.0)  # 0.01 pH
-    Cl_meas = int(max(0.0, state.get("Cl_meas", 0.0)) * 100.0)  # 0.01 mg/L
-    TDS_perm = int(max(0.0, state.get("TDS_perm", 0.0)))  # mg/L
-    dP_ro = int(max(0.0, state.get("dP_ro_meas", 0.0)) * 100.0)  # bar * 100
-
-    values = [
-        Q_feed_meas,  # HR 0
-        Q_perm_meas,  # HR 1
-        level_meas,  # HR 2
-        pH_meas,  # HR 3
-        Cl_meas,  # HR 4
-        TDS_perm,  # HR 5
-        dP_ro,  # HR 6
-    ]
-    slave.setValues(3, 0, values)
 
+def _fast_get_coils(context: ModbusServerContext, twin: WTPTwin, address: int, count: int) -> list:
+    """Read coils straight from the pinned block (equivalent to getValues(1, ...))."""
+    if twin._coil_block is None:
+        twin._coil_block = _BlockView(context[0], 1)
+    return twin._coil_block.get(address, count)
 
-def build_state_payload(twin: WTPTwin, context: Optional[ModbusServerContext]) -> Dict:
-    """Create a serialisable state/controls payload with minimal lock time."""
-    snapshot = twin.snapshot()
+
+def _fast_get_hr(context: ModbusServerContext, twin: WTPTwin, address: int, count: int) -> list:
+    """Read holding registers straight from the pinned block (getValues(3, ...))."""
+    if twin._hr_block is None:
+        twin._hr_block = _BlockView(context[0], 3)
+    return twin._hr_block.get(address, count)
+
+
+# Control coils from address 0, in order
+MODBUS_CONTROL_COILS = (
+    "wellfield_on",  # coil 0
+    "ro_on",  # coil 1
+    "dist_pump_on",  # coil 2
+)
+# Setpoint holding registers from address 100: (control, integer scaling,
+# param holding its default)
+MODBUS_SETPOINTS = (
+    ("NaOH_dose", 100.0, "NaOH_nom"),  # HR 100, 0.01 mg/L
+    ("Cl_dose", 100.0, "Cl_nom"),  # HR 101, 0.01 mg/L
+    ("Q_out_sp", 10.0, "Q_out_nom"),  # HR 102, 0.1 m3/h
+)
+_SETPOINT_ADDRESS = 100
+
+
+def read_controls_from_modbus(context: ModbusServerContext, twin: WTPTwin) -> Dict[str, float]:
+    """
+    Read coils & holding registers and convert to engineering units.
+    Decoding is skipped while the raw register values match the last read.
+    Returns the twin's shared controls cache; treat it as read-only.
+    """
+    coils = _fast_get_coils(context, twin, 0, len(MODBUS_CONTROL_COILS))
+    hr = _fast_get_hr(context, twin, _SETPOINT_ADDRESS, len(MODBUS_SETPOINTS))
+
+    raw = coils + hr
+    cache = twin._controls_cache
+    if raw != twin._controls_raw:
+        # Decode in place so the scan loop reuses one dict for its lifetime
+        for key, value in zip(MODBUS_CONTROL_COILS, coils):
+            cache[key] = bool(value)
+        for (key, scale, _), value in zip(MODBUS_SETPOINTS, hr):
+            cache[key] = value / scale
+        twin._controls_raw = raw
+    return cache
+
+
+def cached_controls(context: ModbusServerContext, twin: WTPTwin) -> Dict[str, float]:
+    """Return a copy of the controls last decoded by the scan loop, reading Modbus only if none."""
+    if twin._controls_raw is None:
+        read_controls_from_modbus(context, twin)
+    return dict(twin._controls_cache)
+
+
+# State fields published to holding registers 0..6 and their integer scaling
+MODBUS_MEAS_KEYS = (
+    "Q_feed_meas",  # HR 0, 0.1 m3/h
+    "Q_perm_meas",  # HR 1, 0.1 m3/h
+    "level_clearwell_meas",  # HR 2, cm
+    "pH_meas",  # HR 3, 0.01 pH
+    "Cl_meas",  # HR 4, 0.01 mg/L
+    "TDS_perm",  # HR 5, mg/L
+    "dP_ro_meas",  # HR 6, bar * 100
+)
+_MEAS_INDICES = np.array([STATE_IDX[k] for k in MODBUS_MEAS_KEYS], dtype=np.intp)
+_MEAS_SCALES = np.array([10.0, 10.0, 100.0, 100.0, 100.0, 1.0, 100.0])
+
+
+def write_measurements_to_modbus(context: ModbusServerContext, twin: WTPTwin, state: np.ndarray) -> None:
+    """Write measured values from a state vector into holding registers (scaled integers)."""
+    if twin._hr_block is None:
+        twin._hr_block = _BlockView(context[0], 3)
+
+    # Scale to integers (OpenPLC-friendly) in one vectorised pass, reusing
+    # the twin's scratch buffers; the int32 cast truncates like int().
+    # Clamp to the 16-bit register range so an out-of-range value saturates
+    # instead of failing when pymodbus encodes the response.
+    buf, regs = twin._meas_buf, twin._meas_regs
+    np.take(state, _MEAS_INDICES, out=buf)
+    np.multiply(buf, _MEAS_SCALES, out=buf)
+    np.clip(buf, 0.0, 65535.0, out=buf)
+    np.copyto(regs, buf, casting="unsafe")
+    twin._hr_block.set(0, regs.tolist())
+
+
+def build_static_payload(twin: WTPTwin) -> Dict:
+    """Create the rarely-changing part of the payload (params and sensor tags)."""
+    with twin._publish_lock:
+        params = dict(twin.params)
+    return {
+        "params": params,
+        "sensors": [sensor._asdict() for sensor in twin.sensors],
+    }
+
+
+def build_dynamic_payload(twin: WTPTwin, context: Optional[ModbusServerContext]) -> Dict:
+    """Create the per-tick part of the payload (time, state, controls)."""
+    sim_time, values = twin._read_published()
     try:
-        controls = read_controls_from_modbus(context, twin) if context is not None else {}
+        controls = cached_controls(context, twin) if context is not None else {}
     except Exception:
         controls = {"error": "modbus unavailable"}
 
     return {
-        "time_s": snapshot["time"],
-        "state": snapshot["state"],
-        "params": snapshot["params"],
+        "time_s": sim_time,
+        "state": dict(zip(STATE_KEYS, values.tolist())),
         "controls": controls,
     }
 
 
+def build_state_payload(twin: WTPTwin, context: Optional[ModbusServerContext]) -> Dict:
+    """Create a serialisable state/controls payload with minimal lock time."""
+    payload = build_dynamic_payload(twin, context)
+    payload["params"] = build_static_payload(twin)["params"]
+    return payload
+
+
+# ---------------------------------------------------------------------------
+# Payload cache: encoded once per simulation tick, shared by all clients
+# ---------------------------------------------------------------------------
+
+# Clients receive one "init" event (static payload) on connect and whenever
+# params change, then "tick" events carrying only the dynamic payload.
+_SSE_INIT_PREFIX = b"event: init\ndata: "
+_SSE_TICK_PREFIX = b"event: tick\ndata: "
+# Seconds between socket flushes on a stream; >0 coalesces several frames
+SSE_FLUSH_INTERVAL = float(os.environ.get("DVWTP_SSE_FLUSH_INTERVAL", "0"))
+# Ticks that change nothing a client can observe are not streamed; idle
+# streams get a comment this often (seconds) so proxies keep them open
+SSE_KEEPALIVE_INTERVAL = 15.0
+_SSE_KEEPALIVE = b": keepalive\n\n"
+
+_stream_cache = {
+    "seq": 0,
+    "frame": b"",  # latest SSE tick frame
+    "init": b"",  # SSE init frame for the current params
+    "params": b"",  # JSON of the current params
+    "state": b"",  # full /api/state JSON body
+    "params_version": -1,
+    "fingerprint": None,  # _frame_fingerprint() of the last streamed tick
+}
+_stream_lock = threading.Lock()
+# Notified under _stream_lock each time "seq" advances
+_stream_cond = threading.Condition(_stream_lock)
+
+
+# State fields the dashboard's render() displays, with the decimals it shows
+DASHBOARD_FIELDS = (
+    ("Q_feed", 1),
+    ("Q_perm", 1),
+    ("Q_out", 1),
+    ("TDS_feed", 0),
+    ("TDS_perm", 0),
+    ("dP_ro_true", 2),
+    ("pH_true", 2),
+    ("Cl_true", 2),
+    ("H2S_out", 2),
+    ("level_clearwell_meas", 2),
+    ("level_clearwell", 2),
+    ("V_clearwell", 1),
+)
+
+
+def _frame_fingerprint(twin: WTPTwin, payload: Dict) -> tuple:
+    """
+    Everything a client can observe from a tick: the dashboard fields as
+    displayed, the measurement registers last written by
+    write_measurements_to_modbus, and the controls.
+    """
+    state = payload["state"]
+    return (
+        tuple(f"{state[k]:.{decimals}f}" for k, decimals in DASHBOARD_FIELDS),
+        twin._meas_regs.tobytes(),
+        tuple(payload["controls"].items()),
+    )
+
+
+def publish_payloads(twin: WTPTwin, context: Optional[ModbusServerContext]) -> None:
+    """
+    Encode the current state for SSE and /api/state and wake stream clients.
+    /api/state is refreshed every tick; a new SSE frame is only published
+    when the fingerprint or params changed.
+    """
+    payload = build_dynamic_payload(twin, context)
+    fingerprint = _frame_fingerprint(twin, payload)
+    dynamic = _dumps(payload)
+    with _stream_lock:
+        params_changed = _stream_cache["params_version"] != twin.params_version
+        if params_changed:
+            static = build_static_payload(twin)
+            _stream_cache["params_version"] = twin.params_version
+            _stream_cache["params"] = _dumps(static["params"])
+            _stream_cache["init"] = _SSE_INIT_PREFIX + _dumps(static) + b"\n\n"
+        # Splice the cached params JSON into the dynamic object rather than
+        # encoding the merged payload a second time
+        _stream_cache["state"] = dynamic[:-1] + b',"params":' + _stream_cache["params"] + b"}"
+        if not params_changed and fingerprint == _stream_cache["fingerprint"]:
+            return
+        frame = _SSE_TICK_PREFIX + dynamic + b"\n\n"
+        if params_changed:
+            frame = _stream_cache["init"] + frame
+        _stream_cache["fingerprint"] = fingerprint
+        _stream_cache["frame"] = frame
+        _stream_cache["seq"] += 1
+        _stream_cond.notify_all()
+
+
 # ---------------------------------------------------------------------------
 # Lightweight web visualisation
 # ---------------------------------------------------------------------------
@@ -546,14 +1120,22 @@ def _dashboard_html() -> str:
       }
 
       const es = new EventSource('/api/stream');
+      let params = {};
       es.onopen = () => setConnection('Live (SSE)', true);
-      es.onmessage = (ev) => {
+      es.addEventListener('init', (ev) => {
         try {
-          render(JSON.parse(ev.data));
+          params = JSON.parse(ev.data).params || {};
         } catch (err) {
           console.error(err);
         }
-      };
+      });
+      es.addEventListener('tick', (ev) => {
+        try {
+          render(Object.assign(JSON.parse(ev.data), { params }));
+        } catch (err) {
+          console.error(err);
+        }
+      });
       es.onerror = () => {
         setConnection('Reconnecting...', false);
         es.close();
@@ -568,12 +1150,25 @@ def _dashboard_html() -> str:
     """
 
 
+# The dashboard is static: encode it and derive its validator once at import
+_DASHBOARD_HTML_BYTES = _dashboard_html().encode("utf-8")
+_DASHBOARD_CONTENT_LENGTH = str(len(_DASHBOARD_HTML_BYTES))
+_DASHBOARD_ETAG = '"' + hashlib.sha1(_DASHBOARD_HTML_BYTES).hexdigest() + '"'
+
+
 class TwinRequestHandler(BaseHTTPRequestHandler):
     twin: WTPTwin
     context: Optional[ModbusServerContext]
 
+    # Keep-alive lets polling clients reuse one connection (and one server
+    # thread) across requests; idle connections are dropped after timeout.
+    protocol_version = "HTTP/1.1"
+    timeout = 30
+
     def _send_json(self, payload: Dict) -> None:
-        data = json.dumps(payload).encode()
+        self._send_json_bytes(_dumps(payload))
+
+    def _send_json_bytes(self, data: bytes) -> None:
         self.send_response(HTTPStatus.OK)
         self.send_header("Content-Type", "application/json")
         self.send_header("Content-Length", str(len(data)))
@@ -582,35 +1177,73 @@ class TwinRequestHandler(BaseHTTPRequestHandler):
 
     def do_GET(self) -> None:  # noqa: N802 - keep BaseHTTPRequestHandler signature
         if self.path == "/":
-            html = _dashboard_html().encode()
+            if self.headers.get("If-None-Match") == _DASHBOARD_ETAG:
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header("ETag", _DASHBOARD_ETAG)
+                self.end_headers()
+                return
             self.send_response(HTTPStatus.OK)
             self.send_header("Content-Type", "text/html; charset=utf-8")
-            self.send_header("Content-Length", str(len(html)))
+            self.send_header("Content-Length", _DASHBOARD_CONTENT_LENGTH)
+            self.send_header("ETag", _DASHBOARD_ETAG)
             self.end_headers()
-            self.wfile.write(html)
+            self.wfile.write(_DASHBOARD_HTML_BYTES)
             return
 
         if self.path == "/api/state":
-            self._send_json(build_state_payload(self.twin, self.context))
+            with _stream_lock:
+                data = _stream_cache["state"]
+            if data:
+                self._send_json_bytes(data)
+            else:  # nothing published yet
+                self._send_json(build_state_payload(self.twin, self.context))
             return
 
         if self.path == "/api/stream":
-            payload = build_state_payload(self.twin, self.context)
             self.send_response(HTTPStatus.OK)
             self.send_header("Content-Type", "text/event-stream")
             self.send_header("Cache-Control", "no-cache")
-            self.send_header("Connection", "keep-alive")
+            # The stream has no length, so its end is the connection closing
+            self.send_header("Connection", "close")
             self.end_headers()
+            # Buffer frames so each flush is a single send; how often to
+            # flush is set by SSE_FLUSH_INTERVAL (0 = after every frame)
+            stream = self.connection.makefile("wb", buffering=8192)
+            last_seq = 0
+            last_flush = float("-inf")  # flush the first frame immediately
+            last_write = time.monotonic()
             try:
+                with _stream_lock:
+                    init, frame = _stream_cache["init"], _stream_cache["frame"]
+                # The tick frame published with a params change already leads
+                # with init; only send it standalone when the next frame won't
+                if init and not frame.startswith(_SSE_INIT_PREFIX):
+                    stream.write(init)
                 while True:
-                    msg = f"data: {json.dumps(payload)}\n\n".encode()
-                    self.wfile.write(msg)
-                    self.wfile.flush()
-                    time.sleep(1.0)
-                    payload = build_state_payload(self.twin, self.context)
+                    # Sleep until the next tick is published; the timeout only
+                    # bounds how long buffered frames can wait for a flush
+                    with _stream_cond:
+                        _stream_cond.wait_for(lambda: _stream_cache["seq"] != last_seq, timeout=1.0)
+                        seq, frame = _stream_cache["seq"], _stream_cache["frame"]
+                    now = time.monotonic()
+                    if seq != last_seq:
+                        stream.write(frame)
+                        last_seq = seq
+                        last_write = now
+                    elif now - last_write >= SSE_KEEPALIVE_INTERVAL:
+                        stream.write(_SSE_KEEPALIVE)
+                        last_write = now
+                    if now - last_flush >= SSE_FLUSH_INTERVAL:
+                        stream.flush()
+                        last_flush = now
             except Exception:
                 # Client closed connection or encountered an error; just exit loop
                 return
+            finally:
+                try:
+                    stream.close()
+                except OSError:
+                    pass  # unsent frames to a disconnected client
 
         self.send_error(HTTPStatus.NOT_FOUND, "Not found")
 
@@ -633,14 +1266,42 @@ def start_http_server(twin: WTPTwin, context: Optional[ModbusServerContext], hos
     return server
 
 
-def run_simulation(context: ModbusServerContext, twin: WTPTwin) -> None:
-    """Background thread that advances the twin and updates Modbus."""
+async def run_simulation_async(context: ModbusServerContext, twin: WTPTwin) -> None:
+    """
+    Task on the Modbus server's event loop that advances the twin and updates
+    Modbus, so scans and Modbus requests share one thread.
+    Ticks are scheduled against absolute monotonic deadlines so work time does
+    not accumulate as drift; after an overrun the missed frames are dropped and
+    the elapsed wall time is integrated in the next step instead.
+    """
+    loop = asyncio.get_running_loop()
     dt = 1.0  # seconds
+    step_dt = dt
+    next_t = loop.time()
     while True:
         controls = read_controls_from_modbus(context, twin)
-        state = twin.step(dt, controls)
-        write_measurements_to_modbus(context, state)
-        time.sleep(dt)
+        twin.step(step_dt, controls)
+        write_measurements_to_modbus(context, twin, twin.state_vector())
+        publish_payloads(twin, context)
+
+        next_t += dt
+        delay = next_t - loop.time()
+        if delay >= 0.0:
+            await asyncio.sleep(delay)
+            step_dt = dt
+        else:
+            now = loop.time()
+            print(f"Simulation overrun by {-delay:.3f}s; dropping missed frame(s)")
+            step_dt = dt + (now - next_t)  # wall time since the previous tick started
+            next_t = now
+
+
+async def _serve(context: ModbusServerContext, twin: WTPTwin) -> None:
+    """Run the simulation task alongside the Modbus TCP server until either fails."""
+    await asyncio.gather(
+        run_simulation_async(context, twin),
+        StartAsyncTcpServer(context=context, address=("0.0.0.0", 5020)),
+    )
 
 
 def main() -> None:
@@ -664,35 +1325,23 @@ def main() -> None:
     twin = WTPTwin()
     p = twin.params
     slave = context[0]
-    defaults = [
-        int(p["NaOH_nom"] * 100.0),  # HR 100
-        int(p["Cl_nom"] * 100.0),  # HR 101
-        int(p["Q_out_nom"] * 10.0),  # HR 102
-    ]
-    slave.setValues(3, 100, defaults)
-
-    # 3) Start simulation thread
-    sim_thread = threading.Thread(
-        target=run_simulation,
-        args=(context, twin),
-        daemon=True,
-    )
-    sim_thread.start()
+    defaults = [int(p[nominal] * scale) for _, scale, nominal in MODBUS_SETPOINTS]
+    slave.setValues(3, _SETPOINT_ADDRESS, defaults)
 
-    # 4) Start lightweight web dashboard
+    # 3) Start lightweight web dashboard
     start_http_server(twin, context, port=8000)
 
-    # 5) Start Modbus TCP server
-    print("Starting CLEAN WTP digital twin Modbus server on 0.0.0.0:5020")
-    print("Coils: 0=wellfield_on, 1=ro_on, 2=dist_pump_on")
-    print(
-        "Holding (setpoints): 100=NaOH_dose*100, 101=Cl_dose*100, 102=Q_out*10",
-    )
+    # 4) Start Modbus TCP server, with the simulation as a task on its loop
+    # Emit the register map as one write rather than a line at a time
     print(
+        "Starting CLEAN WTP digital twin Modbus server on 0.0.0.0:5020\n"
+        "Coils: 0=wellfield_on, 1=ro_on, 2=dist_pump_on\n"
+        "Holding (setpoints): 100=NaOH_dose*100, 101=Cl_dose*100, 102=Q_out*10\n"
         "Holding (measurements): 0=Q_feed*10, 1=Q_perm*10, 2=level*100, "
         "3=pH*100, 4=Cl*100, 5=TDS_perm, 6=dP_ro*100",
+        flush=True,
     )
-    StartTcpServer(context=context, address=("0.0.0.0", 5020))
+    asyncio.run(_serve(context, twin))
 
 
 if __name__ == "__main__":